@@ -3,7 +3,10 @@ PyClaw Agent Module - Uses Claude Agent SDK
 """
 
 import asyncio
+import os
+import threading
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Optional
 
 from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage
@@ -11,6 +14,14 @@ from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage
 from config import GROUPS_DIR, CLAUDE_MODEL, ALLOWED_TOOLS
 
 
+# One shared event loop in a background thread. asyncio.run() per call
+# would build and tear down a fresh loop (plus the SDK's connections)
+# for every message; reusing one loop keeps all of that warm.
+_loop = asyncio.new_event_loop()
+_loop_thread = threading.Thread(target=_loop.run_forever, daemon=True, name="agent-loop")
+_loop_thread.start()
+
+
 @dataclass
 class AgentResponse:
     success: bool
@@ -19,12 +30,33 @@ class AgentResponse:
     error: Optional[str] = None
 
 
+# CLAUDE.md contents per group cwd, keyed by mtime so edits (e.g. via
+# /personality) are picked up without re-reading the file every message
+_claude_md_cache: dict[str, tuple[int, str]] = {}
+
+
+def _read_claude_md(cwd: str) -> str:
+    """Read CLAUDE.md for a group, cached until the file's mtime changes."""
+    claude_md_path = Path(cwd) / "CLAUDE.md"
+    try:
+        mtime_ns = os.stat(claude_md_path).st_mtime_ns
+    except FileNotFoundError:
+        _claude_md_cache.pop(cwd, None)
+        return ""
+
+    cached = _claude_md_cache.get(cwd)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+
+    content = claude_md_path.read_text()
+    _claude_md_cache[cwd] = (mtime_ns, content)
+    return content
+
+
 async def _query_claude(prompt: str, cwd: str, session_id: Optional[str]) -> AgentResponse:
     """Run a single query via SDK."""
-    # Read CLAUDE.md and prepend to system prompt so Claude knows its personality
-    from pathlib import Path
-    claude_md_path = Path(cwd) / "CLAUDE.md"
-    claude_md_content = claude_md_path.read_text() if claude_md_path.exists() else ""
+    # Prepend CLAUDE.md to the system prompt so Claude knows its personality
+    claude_md_content = _read_claude_md(cwd)
 
     # Combine CLAUDE.md with essential working directory info
     system_prompt = f"""{claude_md_content}
@@ -87,17 +119,45 @@ When the user asks you to save, remember, or keep track of something — use the
 """
 
 
-def run_agent(prompt: str, group_folder: str, session_id: Optional[str] = None) -> AgentResponse:
-    """Run Claude agent (sync wrapper)."""
+# Group folders we've already set up this process — saves the mkdir
+# and CLAUDE.md existence checks on every message after the first
+_initialized_groups: set[str] = set()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """The shared background event loop that agent queries run on."""
+    return _loop
+
+
+def _ensure_group_dir(group_folder: str) -> Path:
+    """Create the group's folder and default CLAUDE.md on first use."""
     group_dir = GROUPS_DIR / group_folder
-    group_dir.mkdir(parents=True, exist_ok=True)
 
-    # Create default CLAUDE.md if missing
-    claude_md = group_dir / "CLAUDE.md"
-    if not claude_md.exists():
-        claude_md.write_text(DEFAULT_CLAUDE_MD)
+    if group_folder not in _initialized_groups:
+        group_dir.mkdir(parents=True, exist_ok=True)
+
+        # Create default CLAUDE.md if missing
+        claude_md = group_dir / "CLAUDE.md"
+        if not claude_md.exists():
+            claude_md.write_text(DEFAULT_CLAUDE_MD)
+
+        _initialized_groups.add(group_folder)
 
-    return asyncio.run(_query_claude(prompt, str(group_dir), session_id))
+    return group_dir
+
+
+async def run_agent_async(prompt: str, group_folder: str, session_id: Optional[str] = None) -> AgentResponse:
+    """Run Claude agent — for callers already on the shared event loop."""
+    group_dir = _ensure_group_dir(group_folder)
+    return await _query_claude(prompt, str(group_dir), session_id)
+
+
+def run_agent(prompt: str, group_folder: str, session_id: Optional[str] = None) -> AgentResponse:
+    """Run Claude agent (sync wrapper for callers on other threads)."""
+    future = asyncio.run_coroutine_threadsafe(
+        run_agent_async(prompt, group_folder, session_id), _loop
+    )
+    return future.result()
 
 
 def build_prompt(message_content: str, sender_name: str, group_name: str) -> str:
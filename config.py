@@ -33,8 +33,9 @@ ALLOWED_TOOLS = ["Read", "Write", "Edit", "Glob", "Grep", "WebSearch", "WebFetch
 
 # === TIMING ===
 
-# How often to check for new messages (in seconds)
-POLL_INTERVAL = 2
+# Max time a received message waits before being flushed to SQLite
+# (in seconds) — lets bursts share one transaction
+FLUSH_INTERVAL = 0.05
 
 # === PATHS ===
 
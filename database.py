@@ -9,11 +9,58 @@ The database has two tables:
 """
 
 import sqlite3
+import threading
+from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional
 
 
+# Schema lives in a constant so the timestamp migration can re-run it
+# after renaming the old tables out of the way
+_SCHEMA = """
+    -- Chats table: one row per WhatsApp chat
+    CREATE TABLE IF NOT EXISTS chats (
+        jid TEXT PRIMARY KEY,           -- WhatsApp's unique ID for the chat
+        name TEXT,                       -- Display name
+        last_message_time INTEGER        -- When we last saw a message (epoch µs)
+    );
+
+    -- Messages table: all messages from registered groups
+    CREATE TABLE IF NOT EXISTS messages (
+        id TEXT,                         -- WhatsApp's message ID
+        chat_jid TEXT,                   -- Which chat this belongs to
+        sender TEXT,                     -- Sender's JID (phone number)
+        sender_name TEXT,                -- Sender's display name
+        content TEXT,                    -- The actual message text
+        timestamp INTEGER,               -- Unix epoch microseconds
+        is_from_me INTEGER,              -- 1 if we sent it, 0 otherwise
+        PRIMARY KEY (id, chat_jid)
+    );
+
+    -- Composite index covering the "new messages" query:
+    -- WHERE chat_jid IN (...) AND timestamp > ? ORDER BY timestamp.
+    -- One indexed range scan per JID, no temp b-tree for the sort.
+    CREATE INDEX IF NOT EXISTS idx_messages_chat_ts
+    ON messages(chat_jid, timestamp);
+
+    -- Migration: drop the old single-column indexes the
+    -- composite one makes redundant
+    DROP INDEX IF EXISTS idx_messages_timestamp;
+    DROP INDEX IF EXISTS idx_messages_chat;
+"""
+
+
+def _iso_to_us(value) -> int:
+    """Convert a legacy ISO timestamp to epoch µs (ints pass through)."""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1_000_000)
+    except (TypeError, ValueError):
+        return 0
+
+
 @dataclass
 class Message:
     """A single WhatsApp message."""
@@ -22,7 +69,7 @@ class Message:
     sender: str
     sender_name: str
     content: str
-    timestamp: str
+    timestamp: int
     is_from_me: bool
 
 
@@ -44,40 +91,115 @@ class Database:
         self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
         self.conn.row_factory = sqlite3.Row  # Access columns by name
 
+        # The connection is shared between the flusher thread (writes)
+        # and the dispatcher (startup read) — serialize access ourselves
+        # rather than relying on SQLITE_BUSY retries
+        self._lock = threading.RLock()
+
+        # Tune for a write-heavy workload:
+        # - WAL lets readers run while the ingest thread commits
+        # - synchronous=NORMAL skips the per-commit fsync of the main db
+        #   file (still crash-safe under WAL — worst case loses the last
+        #   uncommitted transaction)
+        # - keep temp structures and more pages in memory
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        self.conn.execute("PRAGMA cache_size=-65536")    # 64 MiB
+
+        # get_new_messages builds its SQL dynamically (one placeholder
+        # per JID) — cache the built strings so repeated calls with the
+        # same shape reuse SQLite's compiled-statement cache
+        self._query_cache: dict[tuple[int, bool], str] = {}
+
         self._create_tables()
 
     def _create_tables(self):
         """Create the database schema if it doesn't exist."""
-        self.conn.executescript("""
-            -- Chats table: one row per WhatsApp chat
-            CREATE TABLE IF NOT EXISTS chats (
-                jid TEXT PRIMARY KEY,           -- WhatsApp's unique ID for the chat
-                name TEXT,                       -- Display name
-                last_message_time TEXT           -- When we last saw a message
-            );
-
-            -- Messages table: all messages from registered groups
-            CREATE TABLE IF NOT EXISTS messages (
-                id TEXT,                         -- WhatsApp's message ID
-                chat_jid TEXT,                   -- Which chat this belongs to
-                sender TEXT,                     -- Sender's JID (phone number)
-                sender_name TEXT,                -- Sender's display name
-                content TEXT,                    -- The actual message text
-                timestamp TEXT,                  -- ISO timestamp
-                is_from_me INTEGER,              -- 1 if we sent it, 0 otherwise
-                PRIMARY KEY (id, chat_jid)
-            );
-
-            -- Index for fast timestamp queries
-            CREATE INDEX IF NOT EXISTS idx_messages_timestamp
-            ON messages(timestamp);
-
-            -- Index for fast chat lookups
-            CREATE INDEX IF NOT EXISTS idx_messages_chat
-            ON messages(chat_jid);
-        """)
+        self.conn.executescript(_SCHEMA)
+        self._migrate_text_timestamps()
         self.conn.commit()
 
+    def _table_exists(self, name: str) -> bool:
+        """True if a table with this name exists."""
+        row = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def _column_type(self, table: str, column: str) -> str:
+        """Declared type of a column (uppercased), or '' if absent."""
+        for row in self.conn.execute(f"PRAGMA table_info({table})"):
+            if row[1] == column:
+                return (row[2] or "").upper()
+        return ""
+
+    def _migrate_text_timestamps(self):
+        """
+        One-time upgrade: convert legacy ISO TEXT timestamps to epoch µs.
+
+        Databases created before the integer-timestamp switch have a
+        `timestamp TEXT` column, and TEXT affinity would keep coercing
+        new integer writes to strings. Move the old tables aside,
+        recreate the current schema, and copy the converted rows over.
+
+        The renames commit individually, so a crash mid-upgrade can
+        leave `messages_old`/`chats_old` behind with an empty new table
+        already in place. We treat a leftover `messages_old` as "resume
+        the upgrade": the copy is INSERT OR REPLACE (idempotent) and
+        shares one transaction with the final drops, so history is
+        never stranded.
+        """
+        resuming = self._table_exists("messages_old")
+        if not resuming and self._column_type("messages", "timestamp") != "TEXT":
+            return  # Already on the integer schema
+
+        print("Migrating database: ISO text timestamps → epoch microseconds...")
+
+        # Move the old tables aside (skipping any an interrupted run
+        # already renamed), then recreate the current schema
+        if not resuming:
+            self.conn.execute("ALTER TABLE messages RENAME TO messages_old")
+        if (not self._table_exists("chats_old")
+                and self._column_type("chats", "last_message_time") == "TEXT"):
+            self.conn.execute("ALTER TABLE chats RENAME TO chats_old")
+        # The composite index followed whichever table carries it —
+        # drop by name so _SCHEMA can rebuild it on the new table
+        self.conn.execute("DROP INDEX IF EXISTS idx_messages_chat_ts")
+        self.conn.executescript(_SCHEMA)
+
+        # Copy the converted rows and drop the old tables in a single
+        # transaction — the upgrade either completes or resumes intact
+        with self.conn:
+            message_rows = [
+                (row[0], row[1], row[2], row[3], row[4], _iso_to_us(row[5]), row[6])
+                for row in self.conn.execute("""
+                    SELECT id, chat_jid, sender, sender_name, content, timestamp, is_from_me
+                    FROM messages_old
+                """)
+            ]
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO messages
+                (id, chat_jid, sender, sender_name, content, timestamp, is_from_me)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, message_rows)
+
+            if self._table_exists("chats_old"):
+                chat_rows = [
+                    (row[0], row[1], _iso_to_us(row[2]))
+                    for row in self.conn.execute(
+                        "SELECT jid, name, last_message_time FROM chats_old"
+                    )
+                ]
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO chats (jid, name, last_message_time)
+                    VALUES (?, ?, ?)
+                """, chat_rows)
+                self.conn.execute("DROP TABLE chats_old")
+
+            self.conn.execute("DROP TABLE messages_old")
+
     def store_message(
         self,
         msg_id: str,
@@ -85,7 +207,7 @@ class Database:
         sender: str,
         sender_name: str,
         content: str,
-        timestamp: str,
+        timestamp: int,
         is_from_me: bool
     ) -> None:
         """
@@ -94,25 +216,59 @@ class Database:
         Uses INSERT OR REPLACE so we don't get duplicates if we
         see the same message twice (WhatsApp can send duplicates).
         """
-        # Update chat metadata
-        self.conn.execute("""
-            INSERT OR REPLACE INTO chats (jid, name, last_message_time)
-            VALUES (?, ?, ?)
-        """, (chat_jid, chat_jid, timestamp))
-
-        # Store the message
-        self.conn.execute("""
-            INSERT OR REPLACE INTO messages
-            (id, chat_jid, sender, sender_name, content, timestamp, is_from_me)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (msg_id, chat_jid, sender, sender_name, content, timestamp, 1 if is_from_me else 0))
+        with self._lock:
+            # Update chat metadata — only dirty the row when the clock
+            # actually advances (INSERT OR REPLACE rewrote it every time)
+            self.conn.execute("""
+                INSERT INTO chats (jid, name, last_message_time)
+                VALUES (?, ?, ?)
+                ON CONFLICT(jid) DO UPDATE
+                SET last_message_time = excluded.last_message_time
+                WHERE excluded.last_message_time > chats.last_message_time
+            """, (chat_jid, chat_jid, timestamp))
 
-        self.conn.commit()
+            # Store the message
+            self.conn.execute("""
+                INSERT OR REPLACE INTO messages
+                (id, chat_jid, sender, sender_name, content, timestamp, is_from_me)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (msg_id, chat_jid, sender, sender_name, content, timestamp, 1 if is_from_me else 0))
+
+            self.conn.commit()
+
+    def store_messages(self, rows: list[tuple]) -> None:
+        """
+        Store a batch of messages in a single transaction.
+
+        Each row is an (id, chat_jid, sender, sender_name, content,
+        timestamp, is_from_me) tuple. One transaction means one commit
+        for the whole batch instead of one per message.
+        """
+        if not rows:
+            return
+
+        # Derive the chat-metadata rows from the message rows
+        chat_rows = [(row[1], row[1], row[5]) for row in rows]
+
+        with self._lock, self.conn:  # commits on success, rolls back on error
+            self.conn.executemany("""
+                INSERT INTO chats (jid, name, last_message_time)
+                VALUES (?, ?, ?)
+                ON CONFLICT(jid) DO UPDATE
+                SET last_message_time = excluded.last_message_time
+                WHERE excluded.last_message_time > chats.last_message_time
+            """, chat_rows)
+
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO messages
+                (id, chat_jid, sender, sender_name, content, timestamp, is_from_me)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
 
     def get_new_messages(
         self,
         chat_jids: list[str],
-        since_timestamp: str,
+        since_timestamp: int,
         exclude_sender_prefix: Optional[str] = None
     ) -> list[Message]:
         """
@@ -120,7 +276,7 @@ class Database:
 
         Args:
             chat_jids: List of chat JIDs to query
-            since_timestamp: ISO timestamp - only get messages after this
+            since_timestamp: Epoch microseconds - only get messages after this
             exclude_sender_prefix: If set, exclude messages where content starts with this
                                    (used to filter out our own bot responses)
 
@@ -130,37 +286,56 @@ class Database:
         if not chat_jids:
             return []
 
-        # Build query with placeholders for each JID
-        placeholders = ",".join("?" * len(chat_jids))
+        # Reuse the query string for this (JID count, filter) shape —
+        # same text means SQLite can reuse its prepared statement.
+        # bool() (not `is not None`) so the key matches the truthiness
+        # checks that decide the clause and the extra binding below
+        cache_key = (len(chat_jids), bool(exclude_sender_prefix))
+        query = self._query_cache.get(cache_key)
 
-        query = f"""
-            SELECT id, chat_jid, sender, sender_name, content, timestamp, is_from_me
-            FROM messages
-            WHERE timestamp > ?
-              AND chat_jid IN ({placeholders})
-            ORDER BY timestamp
-        """
+        if query is None:
+            placeholders = ",".join("?" * len(chat_jids))
+            # Filter our own bot messages inside SQLite instead of
+            # building Message objects just to discard them
+            exclude_clause = (
+                r"AND content NOT LIKE ? ESCAPE '\'" if exclude_sender_prefix else ""
+            )
+            query = f"""
+                SELECT id, chat_jid, sender, sender_name, content, timestamp, is_from_me
+                FROM messages
+                WHERE timestamp > ?
+                  AND chat_jid IN ({placeholders})
+                  {exclude_clause}
+                ORDER BY timestamp
+            """
+            self._query_cache[cache_key] = query
 
-        cursor = self.conn.execute(query, [since_timestamp] + chat_jids)
+        params = [since_timestamp] + chat_jids
+        if exclude_sender_prefix:
+            # Escape LIKE wildcards so the prefix matches literally
+            escaped = (exclude_sender_prefix
+                       .replace("\\", "\\\\")
+                       .replace("%", r"\%")
+                       .replace("_", r"\_"))
+            params.append(escaped + "%")
 
         messages = []
-        for row in cursor:
-            # Skip our own bot messages (they start with "PyClaw:")
-            if exclude_sender_prefix and row["content"].startswith(exclude_sender_prefix):
-                continue
-
-            messages.append(Message(
-                id=row["id"],
-                chat_jid=row["chat_jid"],
-                sender=row["sender"],
-                sender_name=row["sender_name"],
-                content=row["content"],
-                timestamp=row["timestamp"],
-                is_from_me=bool(row["is_from_me"])
-            ))
+        with self._lock:
+            cursor = self.conn.execute(query, params)
+            for row in cursor:
+                messages.append(Message(
+                    id=row["id"],
+                    chat_jid=row["chat_jid"],
+                    sender=row["sender"],
+                    sender_name=row["sender_name"],
+                    content=row["content"],
+                    timestamp=row["timestamp"],
+                    is_from_me=bool(row["is_from_me"])
+                ))
 
         return messages
 
     def close(self):
         """Close the database connection."""
-        self.conn.close()
+        with self._lock:
+            self.conn.close()
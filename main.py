@@ -4,15 +4,18 @@ PyClaw - Personal Claude Assistant via WhatsApp
 This is the main entry point that ties everything together:
 1. Connects to WhatsApp (via Neonize)
 2. Stores messages in SQLite
-3. Polls for new messages
+3. Queues new messages for processing
 4. Triggers Claude agent when someone @mentions PyClaw
 5. Sends the response back to WhatsApp
 
 Architecture:
     WhatsApp (Neonize) → stores → SQLite Database
+                       → pushes → Message Queue
                                       ↓
-                              Poll Loop (every 2s)
+                              Dispatcher (on shared event loop)
                                       ↓
+                              Per-group worker (ordered per group,
+                                      ↓         concurrent across groups)
                               Check trigger (@PyClaw)
                                       ↓
                               Claude Agent SDK
@@ -20,19 +23,33 @@ Architecture:
                               Send response → WhatsApp
 """
 
+import asyncio
+import atexit
+import hashlib
 import json
+import os
+import queue
+import threading
 import time
 import signal
 import sys
+from collections import deque
 from datetime import datetime
 from typing import Optional
 
+# orjson serializes several times faster than stdlib json and returns
+# bytes directly — worth it since save_state runs after every message
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from config import (
     ASSISTANT_NAME,
     TRIGGER_PATTERN,
     CLEAR_COMMAND,
     PERSONALITY_COMMAND,
-    POLL_INTERVAL,
+    FLUSH_INTERVAL,
     DATABASE_PATH,
     SESSIONS_FILE,
     REGISTERED_GROUPS_FILE,
@@ -42,47 +59,99 @@ from config import (
 )
 from database import Database, Message
 from whatsapp import WhatsAppClient, IncomingMessage
-from agent import run_agent, build_prompt
+from agent import run_agent_async, build_prompt, get_event_loop
 
 
 # === STATE MANAGEMENT ===
 # These are loaded from files on startup and saved after each message
 
-# Last timestamp we processed — so we don't re-process old messages
-last_timestamp: str = ""
+# Last timestamp we processed (epoch µs) — so we don't re-process old messages
+last_timestamp: int = 0
 
 # Session IDs per group folder — for Claude conversation continuity
 sessions: dict[str, str] = {}
 
+# Whether `sessions` changed since the last save — they only change when
+# a conversation starts or is cleared, so most saves can skip the file
+# (and its JSON serialization) entirely
+_sessions_dirty = False
+
 # Registered groups — which chats we should respond to
 registered_groups: dict[str, dict] = {}
 
+# Immutable snapshot of the registered JIDs, republished whenever
+# registrations change — the WhatsApp callback thread reads this for
+# its membership check without touching the mutable dict
+_registered_jids: frozenset[str] = frozenset()
+
+# Live messages flow through this queue — the WhatsApp callback pushes,
+# the message loop blocks on get(). No polling, no idle SQL scans.
+msg_queue: queue.Queue[Message] = queue.Queue()
+
+# Messages waiting to be written to SQLite — drained in batches by the
+# flusher thread so a burst shares one transaction (and one fsync)
+_pending_writes: deque = deque()
+_pending_lock = threading.Lock()
+_flush_event = threading.Event()
+
 
 def load_json(path, default):
     """Load JSON file, returning default if it doesn't exist."""
     try:
         if path.exists():
+            if orjson is not None:
+                return orjson.loads(path.read_bytes())
             return json.loads(path.read_text())
     except Exception as e:
         print(f"Warning: Failed to load {path}: {e}")
     return default
 
 
+# Digest of what each path last contained — lets save_json skip writes
+# when the serialized data hasn't changed (sessions rarely do)
+_saved_digests: dict = {}
+
+
 def save_json(path, data):
-    """Save data to JSON file."""
+    """Save data to JSON file atomically, skipping unchanged writes."""
+    if orjson is not None:
+        data_bytes = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        data_bytes = json.dumps(data, indent=2).encode()
+
+    digest = hashlib.md5(data_bytes).digest()
+    if _saved_digests.get(path) == digest:
+        return  # File already has this content
+
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(data, indent=2))
+
+    # Write to a temp file and atomically swap it in — a crash mid-write
+    # can never leave a truncated or half-written state file
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data_bytes)
+    os.replace(tmp, path)
+
+    _saved_digests[path] = digest
 
 
 def load_state():
     """Load all state from files."""
-    global last_timestamp, sessions, registered_groups
+    global last_timestamp, sessions, registered_groups, _registered_jids
 
     state = load_json(STATE_FILE, {})
-    last_timestamp = state.get("last_timestamp", "")
+    last_timestamp = state.get("last_timestamp", 0)
+
+    # State files from before the integer-timestamp switch hold an ISO
+    # string — convert it so comparisons stay int vs int
+    if isinstance(last_timestamp, str):
+        try:
+            last_timestamp = int(datetime.fromisoformat(last_timestamp).timestamp() * 1_000_000)
+        except ValueError:
+            last_timestamp = 0
 
     sessions = load_json(SESSIONS_FILE, {})
     registered_groups = load_json(REGISTERED_GROUPS_FILE, {})
+    _registered_jids = frozenset(registered_groups)
 
     print(f"Loaded state: {len(registered_groups)} registered groups")
     print(f"Last timestamp: {last_timestamp or '(none — will process all new messages)'}")
@@ -90,13 +159,18 @@ def load_state():
 
 def save_state():
     """Save current state to files."""
+    global _sessions_dirty
+
     save_json(STATE_FILE, {"last_timestamp": last_timestamp})
-    save_json(SESSIONS_FILE, sessions)
+
+    if _sessions_dirty:
+        save_json(SESSIONS_FILE, sessions)
+        _sessions_dirty = False
 
 
 # === MESSAGE HANDLING ===
 
-def process_message(msg: Message, db: Database, whatsapp: WhatsAppClient):
+async def process_message(msg: Message, db: Database, whatsapp: WhatsAppClient):
     """
     Process a single message — check trigger, run agent, send response.
 
@@ -111,7 +185,7 @@ def process_message(msg: Message, db: Database, whatsapp: WhatsAppClient):
     8. Send response back to WhatsApp
     9. Save session for conversation continuity
     """
-    global last_timestamp, sessions
+    global last_timestamp, sessions, _sessions_dirty
 
     # Get group config
     group = registered_groups.get(msg.chat_jid)
@@ -120,21 +194,30 @@ def process_message(msg: Message, db: Database, whatsapp: WhatsAppClient):
 
     content = msg.content.strip()
     group_folder = group["folder"]
-
-    # Handle /clear command — resets the conversation
-    if content.lower() == CLEAR_COMMAND:
+    # Bound once, but always called via to_thread — neonize sends are
+    # synchronous network calls and would stall every group's worker if
+    # they ran on the shared loop
+    send = whatsapp.send_message
+
+    # Handle /clear command — resets the conversation.
+    # Length check first: only bother lowercasing when the message is
+    # exactly command-sized, so long bodies are never copied
+    if len(content) == len(CLEAR_COMMAND) and content.lower() == CLEAR_COMMAND:
         if group_folder in sessions:
             del sessions[group_folder]
-            save_state()
+            _sessions_dirty = True
+            async with _state_lock:
+                await asyncio.to_thread(save_state)
             print(f"Session cleared for {group['name']}")
-        whatsapp.send_message(msg.chat_jid, f"*{ASSISTANT_NAME}:* Conversation cleared! Starting fresh.")
+        await asyncio.to_thread(send, msg.chat_jid, f"*{ASSISTANT_NAME}:* Conversation cleared! Starting fresh.")
         return
 
-    # Handle /personality command — updates CLAUDE.md (preserves Memories and Saved Files)
-    if content.lower().startswith(PERSONALITY_COMMAND):
+    # Handle /personality command — updates CLAUDE.md (preserves Memories and Saved Files).
+    # Lowercase only the command-sized prefix, not the whole body
+    if content[:len(PERSONALITY_COMMAND)].lower() == PERSONALITY_COMMAND:
         new_instructions = content[len(PERSONALITY_COMMAND):].strip()
         if not new_instructions:
-            whatsapp.send_message(msg.chat_jid, f"*{ASSISTANT_NAME}:* Usage: /personality <instructions>")
+            await asyncio.to_thread(send, msg.chat_jid, f"*{ASSISTANT_NAME}:* Usage: /personality <instructions>")
             return
 
         claude_md_path = GROUPS_DIR / group_folder / "CLAUDE.md"
@@ -145,7 +228,7 @@ def process_message(msg: Message, db: Database, whatsapp: WhatsAppClient):
         saved_files = "<!-- After creating a file, add it here: \"- filename.txt — description\" -->"
 
         if claude_md_path.exists():
-            existing = claude_md_path.read_text()
+            existing = await asyncio.to_thread(claude_md_path.read_text)
             # Extract Memories section
             if "## Memories" in existing:
                 memories_start = existing.find("## Memories") + len("## Memories")
@@ -179,19 +262,21 @@ When the user asks you to save, remember, or keep track of something — use the
 
 {saved_files}
 """
-        claude_md_path.write_text(new_content)
+        await asyncio.to_thread(claude_md_path.write_text, new_content)
 
-        whatsapp.send_message(msg.chat_jid, f"*{ASSISTANT_NAME}:* Personality updated!")
+        await asyncio.to_thread(send, msg.chat_jid, f"*{ASSISTANT_NAME}:* Personality updated!")
         print(f"Personality updated for {group['name']}")
         return
 
     # Check if message matches trigger pattern
-    if not TRIGGER_PATTERN.match(content):
+    trigger_match = TRIGGER_PATTERN.match(content)
+    if not trigger_match:
         return  # Doesn't start with @PyClaw, ignore
 
-    # Strip the trigger from the message
+    # Strip the trigger from the message — the match already tells us
+    # where it ends, so slice instead of running the regex again
     # "@PyClaw what's the weather?" → "what's the weather?"
-    prompt_text = TRIGGER_PATTERN.sub("", content).strip()
+    prompt_text = content[trigger_match.end():].strip()
     if not prompt_text:
         return  # Empty message after stripping trigger
 
@@ -210,75 +295,121 @@ When the user asks you to save, remember, or keep track of something — use the
     # Get existing session for this group (for conversation continuity)
     session_id = sessions.get(group_folder)
 
-    # Run the Claude agent
+    # Run the Claude agent — awaited directly, we're already on the loop
     print(f"Running Claude agent...")
-    response = run_agent(prompt, group_folder, session_id)
+    response = await run_agent_async(prompt, group_folder, session_id)
 
     if response.success and response.result:
         # Save the new session ID for next time
         if response.session_id:
             sessions[group_folder] = response.session_id
+            _sessions_dirty = True
 
         # Send response to WhatsApp
         reply = f"*{ASSISTANT_NAME}:* {response.result}"
-        whatsapp.send_message(msg.chat_jid, reply)
+        await asyncio.to_thread(send, msg.chat_jid, reply)
         print(f"Response sent: {response.result[:100]}{'...' if len(response.result) > 100 else ''}")
     else:
         # Something went wrong
         error_msg = f"*{ASSISTANT_NAME}:* Sorry, I encountered an error. Please try again."
-        whatsapp.send_message(msg.chat_jid, error_msg)
+        await asyncio.to_thread(send, msg.chat_jid, error_msg)
         print(f"Error: {response.error}")
 
     print(f"{'='*50}\n")
 
 
-def message_loop(db: Database, whatsapp: WhatsAppClient):
+# Per-group asyncio queues — each group gets its own worker coroutine,
+# so one slow Claude turn can't block unrelated groups
+group_queues: dict[str, asyncio.Queue] = {}
+
+# Serializes save_state across the per-group workers
+_state_lock = asyncio.Lock()
+
+
+async def group_worker(chat_jid: str, group_queue: asyncio.Queue,
+                       db: Database, whatsapp: WhatsAppClient):
     """
-    Main polling loop — check for new messages every POLL_INTERVAL seconds.
-
-    This runs continuously:
-    1. Query database for messages newer than last_timestamp
-    2. For each message, call process_message()
-    3. Update last_timestamp after successful processing
-    4. Save state to disk
-    5. Sleep for POLL_INTERVAL seconds
-    6. Repeat
+    Process one group's messages, in order.
+
+    Each group has exactly one worker, so messages within a group stay
+    sequential while different groups run concurrently.
     """
     global last_timestamp
 
+    while True:
+        msg = await group_queue.get()
+        try:
+            await process_message(msg, db, whatsapp)
+            async with _state_lock:
+                # Workers finish out of order across groups — only
+                # ever move the timestamp forward
+                if msg.timestamp > last_timestamp:
+                    last_timestamp = msg.timestamp
+                await asyncio.to_thread(save_state)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+
+
+def dispatch(msg: Message, db: Database, whatsapp: WhatsAppClient):
+    """Route a message to its group's worker, spawning it on first use."""
+    group_queue = group_queues.get(msg.chat_jid)
+    if group_queue is None:
+        group_queue = asyncio.Queue()
+        group_queues[msg.chat_jid] = group_queue
+        asyncio.create_task(group_worker(msg.chat_jid, group_queue, db, whatsapp))
+    group_queue.put_nowait(msg)
+
+
+async def message_loop(db: Database, whatsapp: WhatsAppClient):
+    """
+    Main dispatcher — route incoming messages to per-group workers.
+
+    Runs on the shared agent event loop:
+    1. One startup query for messages that arrived while we were down
+    2. Block (in a helper thread) on msg_queue for live messages
+    3. Route each message to its group's worker coroutine
+
+    Messages stay ordered within a group, but groups run concurrently —
+    a slow Claude turn in one chat doesn't hold up the others.
+    """
     print(f"\nPyClaw is running! (trigger: @{ASSISTANT_NAME})")
-    print(f"Polling for messages every {POLL_INTERVAL} seconds...")
+    print(f"Waiting for messages...")
     print(f"Press Ctrl+C to stop\n")
 
+    # Handle anything that arrived while we were down — dispatched
+    # through the same per-group queues as live traffic. Messages that
+    # land during the connect window get both stored (visible to this
+    # query) and pushed onto msg_queue, so remember what we dispatched
+    # here and drop the live duplicates below.
+    caught_up_ids: set[tuple[str, str]] = set()
+    jids = list(registered_groups.keys())
+    if jids:
+        messages = db.get_new_messages(
+            chat_jids=jids,
+            since_timestamp=last_timestamp,
+            exclude_sender_prefix=f"*{ASSISTANT_NAME}:*",  # Skip our own messages
+        )
+        for msg in messages:
+            caught_up_ids.add((msg.id, msg.chat_jid))
+            dispatch(msg, db, whatsapp)
+
+    # Bind hot lookups to locals — the interpreter re-resolves
+    # attribute/global lookups on every iteration otherwise
+    get_message = msg_queue.get
+
     while True:
-        try:
-            # Get list of registered group JIDs
-            jids = list(registered_groups.keys())
-
-            if jids:
-                # Query for new messages
-                messages = db.get_new_messages(
-                    chat_jids=jids,
-                    since_timestamp=last_timestamp,
-                    exclude_sender_prefix=f"*{ASSISTANT_NAME}:*",  # Skip our own messages
-                )
-
-                for msg in messages:
-                    try:
-                        process_message(msg, db, whatsapp)
-                        # Only advance timestamp after successful processing
-                        last_timestamp = msg.timestamp
-                        save_state()
-                    except Exception as e:
-                        print(f"Error processing message: {e}")
-                        # Don't advance timestamp — will retry next loop
-                        break
+        # msg_queue is a thread queue fed by the WhatsApp callback —
+        # block on it in a helper thread so the loop stays free
+        msg = await asyncio.to_thread(get_message)
 
-        except Exception as e:
-            print(f"Error in message loop: {e}")
+        # Already handled by the startup catch-up? Each entry is only
+        # ever replayed once, so consume it from the set
+        key = (msg.id, msg.chat_jid)
+        if key in caught_up_ids:
+            caught_up_ids.discard(key)
+            continue
 
-        # Wait before next poll
-        time.sleep(POLL_INTERVAL)
+        dispatch(msg, db, whatsapp)
 
 
 # === WHATSAPP EVENT HANDLERS ===
@@ -287,25 +418,70 @@ def on_whatsapp_message(msg: IncomingMessage, db: Database):
     """
     Called when WhatsApp receives a message.
 
-    We store it in the database immediately. The polling loop
-    will pick it up and process it.
+    We store it in the database for persistence, then push it straight
+    onto the queue so the message loop wakes up immediately.
     """
     # Only store messages from registered groups
-    if msg.chat_jid not in registered_groups:
+    if msg.chat_jid not in _registered_jids:
         print(f"[Unregistered] {msg.chat_jid} — {msg.sender_name}: {msg.content[:30]}")
         return
 
     print(f"[Message] {msg.sender_name}: {msg.content[:50]}")
 
-    db.store_message(
-        msg_id=msg.id,
+    # Queue the row for the flusher thread instead of writing directly —
+    # keeps the WhatsApp callback off the fsync path
+    with _pending_lock:
+        _pending_writes.append((
+            msg.id,
+            msg.chat_jid,
+            msg.sender_jid,
+            msg.sender_name,
+            msg.content,
+            msg.timestamp,
+            1 if msg.is_from_me else 0,
+        ))
+    _flush_event.set()
+
+    # Skip our own bot responses — they'd just be filtered in process_message
+    if msg.content.startswith(f"*{ASSISTANT_NAME}:*"):
+        return
+
+    msg_queue.put(Message(
+        id=msg.id,
         chat_jid=msg.chat_jid,
         sender=msg.sender_jid,
         sender_name=msg.sender_name,
         content=msg.content,
         timestamp=msg.timestamp,
         is_from_me=msg.is_from_me,
-    )
+    ))
+
+
+def flush_pending(db: Database):
+    """Write all buffered messages to the database in one transaction."""
+    with _pending_lock:
+        rows = list(_pending_writes)
+        _pending_writes.clear()
+    if rows:
+        db.store_messages(rows)
+
+
+def db_flusher(db: Database):
+    """
+    Background thread: batch pending messages into single transactions.
+
+    Sleeps until the WhatsApp callback signals a new message, then waits
+    FLUSH_INTERVAL so a burst can accumulate before flushing. Idle cost
+    is zero — no timer wakeups when nothing is arriving.
+    """
+    while True:
+        _flush_event.wait()
+        time.sleep(FLUSH_INTERVAL)  # let a burst accumulate
+        _flush_event.clear()
+        try:
+            flush_pending(db)
+        except Exception as e:
+            print(f"Error flushing messages to database: {e}")
 
 
 # === MAIN ===
@@ -336,15 +512,22 @@ def main():
     # Handle graceful shutdown
     def shutdown(signum, frame):
         print("\nShutting down...")
+        flush_pending(db)  # don't lose buffered messages
         db.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
 
+    # Belt and braces: flush state however the process exits
+    atexit.register(save_state)
+
+    # Start the batch flusher (writes buffered messages to SQLite)
+    flusher_thread = threading.Thread(target=db_flusher, args=(db,), daemon=True)
+    flusher_thread.start()
+
     # Connect to WhatsApp (this will show QR code on first run)
     # This runs in background, receiving messages
-    import threading
     whatsapp_thread = threading.Thread(target=whatsapp.connect, daemon=True)
     whatsapp_thread.start()
 
@@ -352,8 +535,12 @@ def main():
     print("Waiting for WhatsApp connection...")
     time.sleep(5)
 
-    # Start the message processing loop (blocks)
-    message_loop(db, whatsapp)
+    # Run the dispatcher on the shared agent event loop; blocking on the
+    # future keeps the main thread alive to service signals
+    future = asyncio.run_coroutine_threadsafe(
+        message_loop(db, whatsapp), get_event_loop()
+    )
+    future.result()
 
 
 if __name__ == "__main__":
@@ -7,10 +7,10 @@ Handles connection to WhatsApp using the Neonize library.
 from pathlib import Path
 from typing import Callable, Optional
 from dataclasses import dataclass
-from datetime import datetime
 
 from neonize.client import NewClient
 from neonize.events import MessageEv, ConnectedEv
+from neonize.proto.Neonize_pb2 import JID
 from neonize.utils import build_jid
 
 from config import AUTH_DIR
@@ -24,7 +24,7 @@ class IncomingMessage:
     sender_jid: str
     sender_name: str
     content: str
-    timestamp: str
+    timestamp: int  # Unix epoch microseconds
     is_from_me: bool
 
 
@@ -38,6 +38,9 @@ class WhatsAppClient:
         self._client = NewClient(str(db_path))
         self._message_handler: Optional[MessageHandler] = None
         self._connected = False
+        # Parsed JID protos per chat string — we send to the same few
+        # chats over and over, no need to rebuild the proto each time
+        self._jid_cache: dict[str, JID] = {}
         self._setup_events()
 
     def _setup_events(self):
@@ -63,8 +66,9 @@ class WhatsAppClient:
             sender = event.Info.MessageSource.Sender
             sender_jid = f"{sender.User}@{sender.Server}"
 
-            # Convert timestamp (milliseconds to ISO)
-            ts = datetime.fromtimestamp(event.Info.Timestamp / 1000).isoformat()
+            # Convert timestamp (milliseconds to epoch microseconds) —
+            # integers compare natively in SQLite, no string parsing
+            ts = event.Info.Timestamp * 1000
 
             msg = IncomingMessage(
                 id=event.Info.ID,
@@ -79,16 +83,29 @@ class WhatsAppClient:
             self._message_handler(msg)
 
     def _extract_content(self, event: MessageEv) -> Optional[str]:
+        # Runs per incoming message, and protobuf attribute access is
+        # not free (descriptor lookup per attr) — so check the by-far
+        # most common case (plain `conversation` text) first and bind
+        # each submessage once instead of re-resolving it.
         msg = event.Message
 
-        if msg.conversation:
-            return msg.conversation
-        if msg.extendedTextMessage and msg.extendedTextMessage.text:
-            return msg.extendedTextMessage.text
-        if msg.imageMessage and msg.imageMessage.caption:
-            return msg.imageMessage.caption
-        if msg.videoMessage and msg.videoMessage.caption:
-            return msg.videoMessage.caption
+        text = msg.conversation
+        if text:
+            return text
+
+        # HasField is cheaper than truth-testing a submessage
+        if msg.HasField("extendedTextMessage"):
+            text = msg.extendedTextMessage.text
+            if text:
+                return text
+        if msg.HasField("imageMessage"):
+            caption = msg.imageMessage.caption
+            if caption:
+                return caption
+        if msg.HasField("videoMessage"):
+            caption = msg.videoMessage.caption
+            if caption:
+                return caption
 
         return None
 
@@ -96,21 +113,23 @@ class WhatsAppClient:
         self._message_handler = handler
 
     def send_message(self, chat_jid: str, text: str):
-        # Parse the JID - format is "user@server"
-        parts = chat_jid.split("@")
-        if len(parts) == 2:
-            from neonize.proto.Neonize_pb2 import JID
+        jid = self._jid_cache.get(chat_jid)
+        if jid is None:
+            # Parse the JID - format is "user@server"
+            user, _, server = chat_jid.partition("@")
+            if not server:
+                print(f"[WhatsApp] Invalid JID format: {chat_jid}")
+                return
             jid = JID(
-                User=parts[0],
-                Server=parts[1],
+                User=user,
+                Server=server,
                 RawAgent=0,
                 Device=0,
                 Integrator=0,
                 IsEmpty=False
             )
-            self._client.send_message(jid, text)
-        else:
-            print(f"[WhatsApp] Invalid JID format: {chat_jid}")
+            self._jid_cache[chat_jid] = jid
+        self._client.send_message(jid, text)
 
     def connect(self):
         print("Connecting to WhatsApp...")